@@ -2,18 +2,31 @@
 kb/build_kb.py
 Reads data/faqs/*.md and data/past_tickets.json, embeds everything via
 OpenAI, and persists to a ChromaDB collection at kb/chroma/.
+Embeddings are cached by content hash in kb/embed_cache.sqlite, so a rebuild
+only pays for texts that actually changed.
 
 Run once (or whenever your data changes):
     python3 kb/build_kb.py
     python3 kb/build_kb.py --force   # wipe and rebuild
+    python3 kb/build_kb.py --batch   # embed via the OpenAI Batch API (50% cheaper, slow)
 """
 
 from __future__ import annotations
+import base64
+import functools
+import hashlib
 import os
+import sqlite3
 import sys
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
+import ijson
+import numpy as np
+import orjson
 from dotenv import load_dotenv
 from openai import OpenAI
 import chromadb
@@ -26,8 +39,24 @@ DATA_DIR     = Path(__file__).parent / "data"
 FAQS_DIR     = DATA_DIR / "faqs"
 TICKETS_FILE = DATA_DIR / "past_tickets.json"
 CHROMA_DIR   = Path(__file__).parent / "chroma"
+EMBED_CACHE  = Path(__file__).parent / "embed_cache.sqlite"
 COLLECTION   = "support_kb"
 
+QUERY_CACHE_SIZE = 2048   # in-memory LRU entries in front of EMBED_CACHE
+SQLITE_MAX_VARS  = 500    # keep IN (...) lookups under SQLite's bound-variable limit
+EMBED_MAX_BATCH  = 2048   # OpenAI's per-request input limit for embeddings
+BUILD_BATCH      = 256    # records buffered per add_batch call while streaming
+FAQ_READ_WORKERS = 16     # threads reading FAQ files concurrently
+
+BATCH_API_MAX      = 50_000   # requests per OpenAI Batch API job
+BATCH_POLL_SECONDS = 30
+BATCH_FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def _text_key(text: str) -> str:
+    """Content hash for the embedding cache — the model is part of the key."""
+    return hashlib.sha256(f"{EMBED_MODEL}\0{text}".encode("utf-8")).hexdigest()
+
 
 # ---------------------------------------------------------------------------
 # VectorStore — wraps ChromaDB with the same .add_batch() / .query() API
@@ -41,20 +70,161 @@ class VectorStore:
             path=str(CHROMA_DIR),
             settings=Settings(anonymized_telemetry=False),
         )
-        self._col = self._client.get_or_create_collection(
+        self._col = self._open_collection()
+        self._count: int | None = None   # memoised _col.count(); reset on writes
+
+        # Persistent text → vector cache so rebuilds and repeated questions
+        # skip the OpenAI round-trip. Queries may run off the main thread,
+        # so the connection is shared behind a lock.
+        self._cache_db   = sqlite3.connect(str(EMBED_CACHE), check_same_thread=False)
+        self._cache_lock = threading.Lock()
+        with self._cache_lock:
+            self._cache_db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(sha256 TEXT PRIMARY KEY, dim INT, vec BLOB)"
+            )
+            self._cache_db.commit()
+        self._embed_query = functools.lru_cache(maxsize=QUERY_CACHE_SIZE)(
+            self._embed_one
+        )
+
+    def _open_collection(self):
+        # Embeddings always come from _embed_cached(); with no embedding
+        # function Chroma can never silently re-embed documents itself.
+        return self._client.get_or_create_collection(
             name=COLLECTION,
             metadata={"hnsw:space": "cosine"},   # cosine distance
+            embedding_function=None,
         )
 
+    # ── embed ────────────────────────────────────────────────────────────
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts as an (N, d) float32 matrix, one request per
+        EMBED_MAX_BATCH inputs.
+
+        Requests base64 output so each vector arrives as packed float32 bytes
+        (~4× smaller than the default JSON float list) and decodes with no
+        per-element Python parsing.
+        """
+        rows = []
+        for i in range(0, len(texts), EMBED_MAX_BATCH):
+            resp = self._oai.embeddings.create(
+                input=texts[i:i + EMBED_MAX_BATCH],
+                model=EMBED_MODEL,
+                encoding_format="base64",
+            )
+            rows.extend(
+                np.frombuffer(base64.b64decode(d.embedding), dtype=np.float32)
+                for d in resp.data
+            )
+        return np.stack(rows)
+
+    def _embed_batch_job(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts through one OpenAI Batch API job and block until it
+        finishes. Same output as _embed(), at half the price, but turnaround
+        can be anything up to the 24h completion window.
+        """
+        lines = [
+            orjson.dumps({
+                "custom_id": str(i),
+                "method":    "POST",
+                "url":       "/v1/embeddings",
+                "body": {
+                    "model":           EMBED_MODEL,
+                    "input":           t,
+                    "encoding_format": "base64",
+                },
+            })
+            for i, t in enumerate(texts)
+        ]
+        upload = self._oai.files.create(
+            file=("embeddings.jsonl", b"\n".join(lines)),
+            purpose="batch",
+        )
+        job = self._oai.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h",
+        )
+        while job.status not in BATCH_FINAL_STATES:
+            time.sleep(BATCH_POLL_SECONDS)
+            job = self._oai.batches.retrieve(job.id)
+
+        if job.status != "completed" or not job.output_file_id:
+            raise RuntimeError(f"Embedding batch {job.id} ended with status {job.status!r}")
+
+        vecs: dict[int, np.ndarray] = {}
+        for line in self._oai.files.content(job.output_file_id).content.splitlines():
+            row  = orjson.loads(line)
+            resp = row.get("response") or {}
+            if row.get("error") or resp.get("status_code") != 200:
+                raise RuntimeError(
+                    f"Embedding batch {job.id}: request {row.get('custom_id')} failed: "
+                    f"{row.get('error') or resp.get('body')}"
+                )
+            vecs[int(row["custom_id"])] = np.frombuffer(
+                base64.b64decode(resp["body"]["data"][0]["embedding"]), dtype=np.float32
+            )
+
+        if len(vecs) != len(texts):
+            raise RuntimeError(
+                f"Embedding batch {job.id} returned {len(vecs)} of {len(texts)} embeddings"
+            )
+        return np.stack([vecs[i] for i in range(len(texts))])
+
+    def _embed_cached(self, texts: list[str], embed=None) -> np.ndarray:
+        """
+        Like _embed(), but looks each text up in EMBED_CACHE by SHA-256 first
+        and only sends the misses to `embed` (default: _embed). Identical
+        texts are embedded once and fanned back out; row order matches `texts`.
+        """
+        keys = [_text_key(t) for t in texts]
+
+        found: dict[str, np.ndarray] = {}
+        with self._cache_lock:
+            for i in range(0, len(keys), SQLITE_MAX_VARS):
+                chunk = keys[i:i + SQLITE_MAX_VARS]
+                rows = self._cache_db.execute(
+                    f"SELECT sha256, vec FROM cache WHERE sha256 IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32)
+
+        # dict keyed by hash: duplicate texts collapse to one input
+        misses = {k: t for k, t in zip(keys, texts) if k not in found}
+        if misses:
+            fresh = (embed or self._embed)(list(misses.values()))
+            with self._cache_lock:
+                self._cache_db.executemany(
+                    "INSERT OR REPLACE INTO cache (sha256, dim, vec) VALUES (?, ?, ?)",
+                    [(k, len(v), v.tobytes()) for k, v in zip(misses, fresh)],
+                )
+                self._cache_db.commit()
+            found.update(zip(misses, fresh))
+
+        return np.stack([found[k] for k in keys])
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        return self._embed_cached([text])[0]
+
     # ── write ────────────────────────────────────────────────────────────
 
-    def add_batch(self, items: list[tuple[str, dict]]) -> None:
-        """Embed and upsert a list of (text, metadata) pairs."""
+    def add_batch(self, items: list[tuple[str, dict]], use_batch_api: bool = False) -> None:
+        """
+        Embed and upsert a list of (text, metadata) pairs.
+        With use_batch_api=True, uncached texts are embedded through an
+        OpenAI Batch API job instead of the synchronous endpoint.
+        """
         texts     = [t for t, _ in items]
         metadatas = [m for _, m in items]
 
-        resp = self._oai.embeddings.create(input=texts, model=EMBED_MODEL)
-        embeddings = [d.embedding for d in resp.data]
+        embed = self._embed_batch_job if use_batch_api else self._embed
+        embeddings = self._embed_cached(texts, embed)
 
         # Chroma requires string IDs — use source_id from metadata
         ids = [m["source_id"] for m in metadatas]
@@ -67,18 +237,17 @@ class VectorStore:
 
         self._col.upsert(
             ids=ids,
-            embeddings=embeddings,
+            embeddings=embeddings.tolist(),
             documents=texts,
             metadatas=safe_metas,
         )
+        self._count = None
 
     def wipe(self) -> None:
         """Delete and recreate the collection."""
         self._client.delete_collection(COLLECTION)
-        self._col = self._client.get_or_create_collection(
-            name=COLLECTION,
-            metadata={"hnsw:space": "cosine"},
-        )
+        self._col = self._open_collection()
+        self._count = 0
 
     # ── read ─────────────────────────────────────────────────────────────
 
@@ -87,16 +256,15 @@ class VectorStore:
         Return top_k results as dicts with keys:
             text, metadata, score   (score = 1 - chroma_distance, so higher = better)
         """
-        if len(self) == 0:
+        n = len(self)
+        if n == 0:
             return []
 
-        q_emb = self._oai.embeddings.create(
-            input=query_text, model=EMBED_MODEL
-        ).data[0].embedding
+        q_emb = self._embed_query(query_text)
 
         results = self._col.query(
-            query_embeddings=[q_emb],
-            n_results=min(top_k, len(self)),
+            query_embeddings=[q_emb.tolist()],
+            n_results=min(top_k, n),
             include=["documents", "metadatas", "distances"],
         )
 
@@ -108,18 +276,20 @@ class VectorStore:
         ):
             # Chroma cosine distance is 1 - similarity; convert back
             score = 1.0 - dist
-            # Re-cast stale back to bool
-            meta = {**meta, "stale": meta.get("stale") == "True"}
+            # Re-cast stale back to bool — Chroma hands back fresh dicts, so in place
+            meta["stale"] = meta.get("stale") == "True"
             out.append({"text": doc, "metadata": meta, "score": score})
 
         return out
 
     def __len__(self) -> int:
-        return self._col.count()
+        if self._count is None:
+            self._count = self._col.count()
+        return self._count
 
 
 # ---------------------------------------------------------------------------
-# Loaders (unchanged from original)
+# Loaders
 # ---------------------------------------------------------------------------
 
 def load_faqs() -> list[tuple[str, dict]]:
@@ -128,8 +298,10 @@ def load_faqs() -> list[tuple[str, dict]]:
     if not md_files:
         print(f"  WARNING: No .md files found in {FAQS_DIR}")
         return items
-    for path in md_files:
-        text = path.read_text(encoding="utf-8").strip()
+    # Reads overlap I/O waits; map() keeps sorted order so source_ids are stable
+    with ThreadPoolExecutor(max_workers=FAQ_READ_WORKERS) as pool:
+        texts = list(pool.map(lambda p: p.read_text(encoding="utf-8").strip(), md_files))
+    for path, text in zip(md_files, texts):
         items.append((
             text,
             {
@@ -142,65 +314,84 @@ def load_faqs() -> list[tuple[str, dict]]:
     return items
 
 
-def load_past_tickets() -> list[tuple[str, dict]]:
-    with open(TICKETS_FILE, encoding="utf-8") as f:
-        tickets = json.load(f)
-
-    items = []
-    for t in tickets:
-        text = (
-            f"Customer question: {t['question']}\n"
-            f"Resolution: {t['resolution']}"
-        )
-        is_stale = (
-            "STALE" in t.get("resolution", "").upper()
-            or "NO LONGER VALID" in t.get("resolution", "").upper()
-        )
-        items.append((
-            text,
-            {
-                "source_id": f"ticket-{t['id']}",
-                "type":      "past_ticket",
-                "id":        t["id"],
-                "category":  t["category"],
-                "status":    "resolved",
-                "stale":     is_stale,   # stored as bool, cast to str on upsert
-            },
-        ))
-    return items
+def load_past_tickets() -> Iterator[tuple[str, dict]]:
+    """
+    Stream (text, metadata) pairs from TICKETS_FILE one ticket at a time,
+    so a large archive is never fully materialised in memory.
+    """
+    with open(TICKETS_FILE, "rb") as f:
+        for t in ijson.items(f, "item"):
+            yield _ticket_item(t)
+
+
+def _ticket_item(t: dict) -> tuple[str, dict]:
+    text = (
+        f"Customer question: {t['question']}\n"
+        f"Resolution: {t['resolution']}"
+    )
+    is_stale = (
+        "STALE" in t.get("resolution", "").upper()
+        or "NO LONGER VALID" in t.get("resolution", "").upper()
+    )
+    return (
+        text,
+        {
+            "source_id": f"ticket-{t['id']}",
+            "type":      "past_ticket",
+            "id":        t["id"],
+            "category":  t["category"],
+            "status":    "resolved",
+            "stale":     is_stale,   # stored as bool, cast to str on upsert
+        },
+    )
 
 
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
 
-def build(force: bool = False) -> VectorStore:
+def build(force: bool = False, use_batch_api: bool = False) -> VectorStore:
     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     store  = VectorStore(client)
+    n      = len(store)
 
-    if len(store) > 0 and not force:
-        print(f"Chroma collection '{COLLECTION}' already has {len(store)} records.")
+    if n > 0 and not force:
+        print(f"Chroma collection '{COLLECTION}' already has {n} records.")
         print("Pass --force to wipe and rebuild.\n")
         return store
 
-    if force and len(store) > 0:
-        print(f"--force: wiping existing {len(store)} records...")
+    if force and n > 0:
+        print(f"--force: wiping existing {n} records...")
         store.wipe()
 
     print("Building knowledge base from scratch...\n")
+    if use_batch_api:
+        print("  --batch: embedding via the OpenAI Batch API — this can take a while")
+
+    # The Batch API is priced per input and slow to turn around, so submit
+    # as few jobs as possible rather than one per streaming buffer
+    flush_at = BATCH_API_MAX if use_batch_api else BUILD_BATCH
 
     faq_items = load_faqs()
     print(f"  Found {len(faq_items)} FAQ files in {FAQS_DIR}")
-    if faq_items:
-        store.add_batch(faq_items)
 
-    ticket_items = load_past_tickets()
-    print(f"  Found {len(ticket_items)} past tickets in {TICKETS_FILE}")
-    stale = sum(1 for _, m in ticket_items if m.get("stale"))
+    # Tickets are streamed; FAQs and tickets share one buffer so a small KB
+    # is still a single embed + upsert pass
+    buffer = list(faq_items)
+    n_tickets = stale = 0
+    for item in load_past_tickets():
+        n_tickets += 1
+        stale += item[1]["stale"]
+        buffer.append(item)
+        if len(buffer) >= flush_at:
+            store.add_batch(buffer, use_batch_api=use_batch_api)
+            buffer = []
+    if buffer:
+        store.add_batch(buffer, use_batch_api=use_batch_api)
+
+    print(f"  Found {n_tickets} past tickets in {TICKETS_FILE}")
     if stale:
         print(f"  ⚠  {stale} ticket(s) flagged as stale — indexed but marked")
-    if ticket_items:
-        store.add_batch(ticket_items)
 
     print(f"\nTotal records in Chroma: {len(store)}")
     print(f"Persisted at: {CHROMA_DIR}\n")
@@ -209,5 +400,6 @@ def build(force: bool = False) -> VectorStore:
 
 if __name__ == "__main__":
     force = "--force" in sys.argv
-    build(force=force)
+    use_batch_api = "--batch" in sys.argv
+    build(force=force, use_batch_api=use_batch_api)
     print("Done. Run 'python3 cli.py' to process tickets.")
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+pipeline/cache.py
+Content-addressed SQLite cache for LLM step results (triage, research).
+
+Keys are SHA-256 hashes of everything that determines a step's output — the
+prompt inputs, the model, and a prompt version — so duplicate tickets and
+reruns skip the API entirely, while a model or prompt change simply misses.
+Entries expire after a TTL so nothing is served forever.
+"""
+
+from __future__ import annotations
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+import orjson
+
+CACHE_FILE  = Path(__file__).parent / "result_cache.sqlite"
+DEFAULT_TTL = 7 * 86400   # seconds
+
+
+def content_key(namespace: str, **parts) -> str:
+    """Stable hash of a step name plus its keyword inputs."""
+    blob = orjson.dumps({"ns": namespace, **parts}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(blob).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: Path = CACHE_FILE, ttl: int = DEFAULT_TTL):
+        self._ttl = ttl
+        self._db  = sqlite3.connect(str(path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached dict for key, or None if missing or expired."""
+        row = self._db.execute(
+            "SELECT value, expires FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires < time.time():
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        return orjson.loads(value)
+
+    def set(self, key: str, value: dict) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (key, orjson.dumps(value), time.time() + self._ttl),
+        )
+        self._db.commit()
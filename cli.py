@@ -8,29 +8,29 @@ Usage:
     python3 cli.py --id TEST007       # run a single ticket by ID
     python3 cli.py --limit 3          # run first N tickets
     python3 cli.py --build            # force-rebuild the KB cache first
+    python3 cli.py --sequential       # one ticket at a time, with step-by-step logs
+    python3 cli.py --no-cache         # ignore cached triage/research results
 """
 
 from __future__ import annotations
 import argparse
-import json
-import os
+import asyncio
 import sys
 from pathlib import Path
 
 from dotenv import load_dotenv
 import anthropic
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI
 
-# ── Path setup ───────────────────────────────────────────────────────────────
-ROOT = Path(__file__).parent
-sys.path.insert(0, str(ROOT / "kb"))
-sys.path.insert(0, str(ROOT))
-
-from build_kb import VectorStore, build          # noqa: E402
-from orchestrator import run_pipeline      # noqa: E402
+from build_kb import VectorStore, build
+from cache import ResultCache
+from clients import ClientPool, get_anthropic_pool, get_openai_pool
+from orchestrator import process_batch, run_pipeline
 
 load_dotenv()
 
+ROOT = Path(__file__).parent
 DATA_DIR = ROOT / "data"
 TEST_TICKETS_FILE = DATA_DIR / "test_tickets.json"
 
@@ -47,13 +47,17 @@ PRIORITY_BADGE = {
 
 def print_result(result: dict) -> None:
     ticket = result["ticket"]
-    triage = result["triage"]
+    triage = result["triage"] or {}
     draft = result.get("draft")
 
     print(f"\n{'═'*60}")
     print(f"  {ticket['id']} | {ticket.get('subject', '')}")
     print(f"{'═'*60}")
 
+    if result.get("error"):
+        print(f"  RESULT   ✖ Failed — {result['error']}\n")
+        return
+
     # Triage summary
     badge = PRIORITY_BADGE.get(triage.get("priority", "medium"), "⚪")
     print(f"  TRIAGE   {badge} | {triage.get('category','?')} | {triage.get('reasoning','')}")
@@ -63,9 +67,10 @@ def print_result(result: dict) -> None:
         return
 
     # Research summary
-    matches = result.get("research", {}).get("matches", [])
-    stale_ids = result.get("research", {}).get("stale_ids", [])
-    search_terms = result.get("research", {}).get("search_terms_used", [])
+    research = result.get("research") or {}
+    matches = research.get("matches", [])
+    stale_ids = research.get("stale_ids", [])
+    search_terms = research.get("search_terms_used", [])
     print(f"  RESEARCH {len(matches)} match(es) | terms: {search_terms}"
           + (f" | ⚠  stale: {stale_ids}" if stale_ids else "")
           + (f" | {result['retries']} retry(s)" if result["retries"] else ""))
@@ -84,6 +89,7 @@ def print_result(result: dict) -> None:
 def print_summary(results: list[dict]) -> None:
     total = len(results)
     spam = sum(1 for r in results if r["skipped"])
+    failed = sum(1 for r in results if r.get("error"))
     retried = sum(1 for r in results if r.get("retries", 0) > 0)
     stale_warnings = sum(
         1 for r in results
@@ -94,11 +100,56 @@ def print_summary(results: list[dict]) -> None:
     print(f"  SUMMARY: {total} tickets processed")
     print(f"{'═'*60}")
     print(f"  ⛔ Spam / skipped        : {spam}")
+    print(f"  ✖  Failed                : {failed}")
     print(f"  ↺  Research retries used : {retried}")
     print(f"  ⚠  Stale source warnings : {stale_warnings}")
     print()
 
 
+# ── Runner ───────────────────────────────────────────────────────────────────
+
+async def run_tickets(
+    tickets: list[dict],
+    store: VectorStore,
+    claude_client: anthropic.AsyncAnthropic | ClientPool,
+    oai_client: AsyncOpenAI | ClientPool,
+    sequential: bool = False,
+    cache: ResultCache | None = None,
+) -> list[dict]:
+    """
+    Run every ticket through the pipeline and return results in ticket order.
+
+    Sequential mode processes one ticket at a time with verbose step logs and
+    prints each result as it lands. Otherwise tickets run concurrently through
+    process_batch() and results are printed once all have finished.
+    """
+    if sequential:
+        results = []
+        for ticket in tickets:
+            result = await run_pipeline(
+                ticket=ticket,
+                store=store,
+                claude_client=claude_client,
+                oai_client=oai_client,
+                verbose=True,
+                cache=cache,
+            )
+            print_result(result)
+            results.append(result)
+        return results
+
+    results = await process_batch(
+        tickets,
+        store=store,
+        claude_client=claude_client,
+        oai_client=oai_client,
+        cache=cache,
+    )
+    for result in results:
+        print_result(result)
+    return results
+
+
 # ── Main ─────────────────────────────────────────────────────────────────────
 
 def main() -> None:
@@ -106,19 +157,22 @@ def main() -> None:
     parser.add_argument("--id",    help="Run a single ticket by ID (e.g. TEST007)")
     parser.add_argument("--limit", type=int, help="Only process first N tickets")
     parser.add_argument("--build", action="store_true", help="Force-rebuild KB cache")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Process tickets one at a time with verbose logs (debugging)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-run triage/research instead of reusing cached results")
     args = parser.parse_args()
 
     # ── Clients ──────────────────────────────────────────────────────────
-    claude_client = anthropic.Anthropic(api_key=os.getenv("CLAUDE_API_KEY"))
-    oai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    claude_client = get_anthropic_pool()
+    oai_client = get_openai_pool()
 
     # ── Knowledge base ───────────────────────────────────────────────────
     print("Loading knowledge base...")
     store: VectorStore = build(force=args.build)
 
     # ── Load test tickets ─────────────────────────────────────────────────
-    with open(TEST_TICKETS_FILE, encoding="utf-8") as f:
-        all_tickets: list[dict] = json.load(f)
+    all_tickets: list[dict] = orjson.loads(TEST_TICKETS_FILE.read_bytes())
 
     if args.id:
         tickets = [t for t in all_tickets if t["id"] == args.id]
@@ -133,17 +187,14 @@ def main() -> None:
     print(f"Running {len(tickets)} ticket(s) through the pipeline...\n")
 
     # ── Run pipeline ──────────────────────────────────────────────────────
-    results = []
-    for ticket in tickets:
-        result = run_pipeline(
-            ticket=ticket,
-            store=store,
-            claude_client=claude_client,
-            oai_client=oai_client,
-            verbose=True,
-        )
-        print_result(result)
-        results.append(result)
+    results = asyncio.run(run_tickets(
+        tickets,
+        store=store,
+        claude_client=claude_client,
+        oai_client=oai_client,
+        sequential=args.sequential,
+        cache=None if args.no_cache else ResultCache(),
+    ))
 
     if len(results) > 1:
         print_summary(results)
@@ -0,0 +1,274 @@
+"""
+pipeline/clients.py
+Process-wide Anthropic / OpenAI async clients.
+
+Every pipeline step accepts an explicit client but falls back to these
+singletons, so all calls share one pooled connection per provider (HTTP/2
+when the optional h2 package is installed) instead of paying a TCP + TLS
+handshake per client.
+
+Each provider can have several endpoints (API keys, optionally with their
+own base URL — e.g. a second account or an OpenAI-compatible mirror).
+get_openai_pool() / get_anthropic_pool() spread calls across them through a
+ClientPool, failing over to the next endpoint on transient errors.
+get_openai() / get_anthropic() return the first endpoint's client, for calls
+that must stay on one account (Batch API uploads and polling).
+
+Pooled connections belong to the event loop they were opened on: call
+close_clients() before that loop ends so the next asyncio.run() gets fresh
+clients. run_sync() does both, for the blocking wrappers of each step.
+
+call_with_retry() is the single retry policy for API calls: the shared
+clients have SDK-level retries turned off so the two don't stack.
+"""
+
+from __future__ import annotations
+import asyncio
+import importlib.util
+import os
+import random
+import time
+
+import anthropic
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+HTTP2       = importlib.util.find_spec("h2") is not None   # httpx needs h2 for HTTP/2
+
+ENDPOINT_CONCURRENCY = 32  # in-flight calls per endpoint
+LATENCY_DECAY = 0.2        # EWMA weight of the newest latency sample
+AUTH_COOLDOWN = 600        # seconds an endpoint with a rejected key sits out
+
+RETRY_ATTEMPTS = 5
+RETRY_MIN_WAIT = 1    # seconds
+RETRY_MAX_WAIT = 30   # seconds
+
+# Transient failures worth retrying — the SDKs' own rule: timeouts / dropped
+# connections, and these statuses or any 5xx (incl. Anthropic's 529 overloaded)
+RETRY_STATUSES    = {408, 409, 429}
+CONNECTION_ERRORS = (anthropic.APIConnectionError, openai.APIConnectionError)
+STATUS_ERRORS     = (anthropic.APIStatusError, openai.APIStatusError)
+
+# Not worth retrying on the same endpoint, but another endpoint's key may work
+AUTH_ERRORS = (
+    anthropic.AuthenticationError, anthropic.PermissionDeniedError,
+    openai.AuthenticationError, openai.PermissionDeniedError,
+)
+
+_openai_pool: ClientPool | None = None
+_anthropic_pool: ClientPool | None = None
+
+
+# ── Client pool ──────────────────────────────────────────────────────────────
+
+class _Endpoint:
+    """One client plus the health state the pool ranks it by."""
+
+    def __init__(self, client):
+        self.client = client
+        self.sem = asyncio.Semaphore(ENDPOINT_CONCURRENCY)
+        self.in_flight = 0
+        self.latency = 1.0        # EWMA seconds per call
+        self.failures = 0         # consecutive transient failures
+        self.cooldown_until = 0.0
+
+    def score(self, now: float) -> tuple[bool, float]:
+        # Healthy endpoints first, then the one expected to answer soonest
+        return now < self.cooldown_until, self.latency * (self.in_flight + 1)
+
+    def ok(self, elapsed: float) -> None:
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.latency += LATENCY_DECAY * (elapsed - self.latency)
+
+    def failed(self, wait: float | None = None) -> None:
+        self.failures += 1
+        if wait is None:
+            wait = min(RETRY_MAX_WAIT, RETRY_MIN_WAIT * 2 ** self.failures)
+        self.cooldown_until = time.monotonic() + wait
+
+
+class _Route:
+    """Attribute path into the SDK (pool.chat.completions.create), callable."""
+
+    def __init__(self, pool: ClientPool, path: tuple[str, ...]):
+        self._pool = pool
+        self._path = path
+
+    def __getattr__(self, name: str) -> _Route:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _Route(self._pool, self._path + (name,))
+
+    def __call__(self, **kwargs):
+        return self._pool.call(self._path, **kwargs)
+
+
+class ClientPool:
+    """
+    Several clients for one provider behind the SDK's own call surface, so
+    pipeline steps take a pool or a bare client interchangeably.
+
+    Each call goes to the healthiest endpoint (not cooling down after a
+    transient failure, lowest latency × load) under that endpoint's semaphore.
+    A retryable failure puts the endpoint in a growing cooldown and
+    the call fails over to the next one; only when every endpoint has failed
+    does the error reach call_with_retry() to back off. A rejected key
+    (401/403) fails over the same way but sits out for AUTH_COOLDOWN.
+    """
+
+    def __init__(self, clients: list):
+        self._endpoints = [_Endpoint(c) for c in clients]
+
+    @property
+    def primary(self):
+        return self._endpoints[0].client
+
+    def __len__(self) -> int:
+        return len(self._endpoints)
+
+    async def aclose(self) -> None:
+        for ep in self._endpoints:
+            await ep.client.close()
+
+    def __getattr__(self, name: str) -> _Route:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _Route(self, (name,))
+
+    async def call(self, path: tuple[str, ...], **kwargs):
+        transient = denied = None
+        now = time.monotonic()
+        for ep in sorted(self._endpoints, key=lambda e: e.score(now)):
+            create = ep.client
+            for name in path:
+                create = getattr(create, name)
+            ep.in_flight += 1  # counted while queued on the semaphore too
+            try:
+                async with ep.sem:
+                    start = time.monotonic()
+                    response = await create(**kwargs)
+            except AUTH_ERRORS as e:
+                ep.failed(AUTH_COOLDOWN)
+                denied = e
+                continue
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                ep.failed()
+                transient = e
+                continue
+            finally:
+                ep.in_flight -= 1
+            ep.ok(time.monotonic() - start)
+            return response
+        # Prefer the transient error so call_with_retry still backs off and retries
+        raise transient or denied
+
+
+# ── Singletons ───────────────────────────────────────────────────────────────
+
+def _http_client(sdk):
+    # Each SDK's own client class keeps its default timeouts and the httpx
+    # flavour that SDK expects
+    return sdk.DefaultAsyncHttpxClient(http2=HTTP2, limits=HTTP_LIMITS)
+
+
+def _endpoints(keys_var: str, key_var: str, urls_var: str) -> list[tuple[str | None, str | None]]:
+    """
+    (api_key, base_url) pairs from the environment: comma-separated keys in
+    keys_var (falling back to the single key_var) with optional base URLs in
+    urls_var, matched by position. Empty or missing URL = provider default.
+    """
+    keys = [k.strip() for k in os.getenv(keys_var, "").split(",") if k.strip()]
+    keys = keys or [os.getenv(key_var)]
+    urls = [u.strip() or None for u in os.getenv(urls_var, "").split(",")]
+    return [(key, urls[i] if i < len(urls) else None) for i, key in enumerate(keys)]
+
+
+def get_openai_pool() -> ClientPool:
+    global _openai_pool
+    if _openai_pool is None:
+        _openai_pool = ClientPool([
+            AsyncOpenAI(
+                api_key=key,
+                base_url=url,
+                http_client=_http_client(openai),
+                max_retries=0,
+            )
+            for key, url in _endpoints("OPENAI_API_KEYS", "OPENAI_API_KEY", "OPENAI_BASE_URLS")
+        ])
+    return _openai_pool
+
+
+def get_anthropic_pool() -> ClientPool:
+    global _anthropic_pool
+    if _anthropic_pool is None:
+        _anthropic_pool = ClientPool([
+            anthropic.AsyncAnthropic(
+                api_key=key,
+                base_url=url,
+                http_client=_http_client(anthropic),
+                max_retries=0,
+            )
+            for key, url in _endpoints("CLAUDE_API_KEYS", "CLAUDE_API_KEY", "CLAUDE_BASE_URLS")
+        ])
+    return _anthropic_pool
+
+
+def get_openai() -> AsyncOpenAI:
+    return get_openai_pool().primary
+
+
+def get_anthropic() -> anthropic.AsyncAnthropic:
+    return get_anthropic_pool().primary
+
+
+async def close_clients() -> None:
+    """Close the shared pools and drop them; the next get_*() call builds new ones."""
+    global _openai_pool, _anthropic_pool
+    pools = [p for p in (_openai_pool, _anthropic_pool) if p is not None]
+    _openai_pool = _anthropic_pool = None
+    for pool in pools:
+        await pool.aclose()
+
+
+def run_sync(coro):
+    """Run coro to completion on a fresh event loop, closing the shared clients before it ends."""
+    async def run():
+        try:
+            return await coro
+        finally:
+            await close_clients()
+
+    return asyncio.run(run())
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, CONNECTION_ERRORS):
+        return True
+    return isinstance(e, STATUS_ERRORS) and (
+        e.status_code in RETRY_STATUSES or e.status_code >= 500
+    )
+
+
+async def call_with_retry(create, **kwargs):
+    """
+    Await create(**kwargs), retrying is_retryable() errors up to RETRY_ATTEMPTS times
+    with jittered exponential backoff (random wait, ceiling doubling from
+    RETRY_MIN_WAIT up to RETRY_MAX_WAIT) so recovering clients don't stampede.
+    """
+    for attempt in range(RETRY_ATTEMPTS - 1):
+        try:
+            return await create(**kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            ceiling = min(RETRY_MAX_WAIT, RETRY_MIN_WAIT * 2 ** (attempt + 1))
+            await asyncio.sleep(random.uniform(RETRY_MIN_WAIT, ceiling))
+    return await create(**kwargs)
@@ -13,9 +13,10 @@ Internal fields also returned for orchestrator/display:
 """
 
 from __future__ import annotations
-import json
-import re
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI
+
+from clients import ClientPool, call_with_retry, get_openai_pool, run_sync
 
 
 SYSTEM_PROMPT = """You are a friendly, professional customer-support agent for a SaaS platform.
@@ -33,7 +34,7 @@ Tone guidelines:
 - For high/urgent priority tickets: acknowledge urgency in the opening line
 - If context is insufficient: say so honestly and offer next steps (escalate, ask clarifying Q)
 
-Reply with ONLY a JSON object — no prose, no markdown fences:
+Reply with a JSON object:
 {
   "response_text": "<full reply — use \\n for line breaks>",
   "sources_used": ["<source_id of each KB item that informed the reply>"],
@@ -41,19 +42,11 @@ Reply with ONLY a JSON object — no prose, no markdown fences:
 }"""
 
 
-def _extract_json(text: str) -> dict:
-    text = re.sub(r"```(?:json)?", "", text).strip().rstrip("```").strip()
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if not match:
-        raise ValueError(f"No JSON found in drafter response:\n{text}")
-    return json.loads(match.group())
-
-
-def drafter(
+async def drafter(
     ticket: dict,
     triage_result: dict,
     research_result: dict,
-    client: OpenAI,
+    client: AsyncOpenAI | ClientPool | None = None,
 ) -> dict:
     """
     Draft a reply given the ticket, triage classification, and research matches.
@@ -82,17 +75,25 @@ def drafter(
         f"KNOWLEDGE BASE CONTEXT\n{context_text}"
     )
 
-    response = client.chat.completions.create(
+    client = client or get_openai_pool()
+    response = await call_with_retry(
+        client.chat.completions.create,
         model="gpt-4o-mini",
         temperature=0.3,
+        response_format={"type": "json_object"},   # guaranteed bare JSON, no fences
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_message},
         ],
     )
 
-    result = _extract_json(response.choices[0].message.content)
+    result = orjson.loads(response.choices[0].message.content)
     result.setdefault("response_text", "")
     result.setdefault("sources_used", [])
     result.setdefault("stale_warning", False)
-    return result
\ No newline at end of file
+    return result
+
+
+def drafter_sync(ticket: dict, triage_result: dict, research_result: dict, **kwargs) -> dict:
+    """Blocking drafter() for synchronous callers."""
+    return run_sync(drafter(ticket, triage_result, research_result, **kwargs))
@@ -1,38 +1,48 @@
 """
 pipeline/orchestrator.py
-Wires triage → research → drafter into a single pipeline call.
+Wires triage → research → drafter into a single pipeline call, and fans
+many tickets out concurrently via process_batch().
 
 Handles:
+- Result cache lookups (skip Claude/GPT for tickets already seen)
 - Spam short-circuit after triage
 - Research retry loop (up to MAX_RETRIES) when has_enough_info=False
+- Per-ticket failures in process_batch (recorded in "error", batch carries on)
+
+Transient API errors are retried per call inside each step (clients.call_with_retry).
 """
 
 from __future__ import annotations
-import sys
-from pathlib import Path
+import asyncio
 
 import anthropic
-from openai import OpenAI
-
-sys.path.insert(0, str(Path(__file__).parent.parent / "kb"))
-from build_kb import VectorStore  # noqa: E402
+from openai import AsyncOpenAI
 
-from triage import triage
+from build_kb import VectorStore
+from cache import ResultCache
+from clients import ClientPool, run_sync
+from triage import cache_key as triage_key, cache_lookup as triage_lookup, triage, triage_batch
 from research import research
 from drafter import drafter
 
 MAX_RETRIES = 2  # max research retries before drafting anyway
+MAX_CONCURRENCY = 8  # tickets in flight at once — keeps us under provider RPM limits
 
 
-def run_pipeline(
+async def run_pipeline(
     ticket: dict,
     store: VectorStore,
-    claude_client: anthropic.Anthropic,
-    oai_client: OpenAI,
+    claude_client: anthropic.AsyncAnthropic | ClientPool | None = None,
+    oai_client: AsyncOpenAI | ClientPool | None = None,
     verbose: bool = True,
+    cache: ResultCache | None = None,
+    triage_result: dict | None = None,
 ) -> dict:
     """
     Process one ticket through the full pipeline.
+    Clients default to the shared pooled instances from clients.py.
+    If cache is given, triage and research results are read from / written to it.
+    A precomputed triage_result (e.g. from triage_batch) skips step 1's call.
 
     Returns:
         {
@@ -42,6 +52,7 @@ def run_pipeline(
             "draft":    dict | None,  # {response_text, sources_used}
             "skipped":  bool,
             "retries":  int,
+            "error":    str | None,  # set by process_batch when the ticket failed
         }
     """
     def log(msg: str) -> None:
@@ -55,6 +66,7 @@ def run_pipeline(
         "draft": None,
         "skipped": False,
         "retries": 0,
+        "error": None,
     }
 
     # ── Step 1: Triage ────────────────────────────────────────────────────
@@ -63,7 +75,14 @@ def run_pipeline(
     log(f"{'─'*55}")
     log("  [1/3] Triage...")
 
-    triage_result = triage(ticket, claude_client)
+    if triage_result is None and cache:
+        triage_result = triage_lookup(ticket, cache)
+    if triage_result is not None:
+        log("       (precomputed)")
+    else:
+        triage_result = await triage(ticket, client=claude_client)
+        if cache:
+            cache.set(triage_key(ticket), triage_result)
     result["triage"] = triage_result
 
     log(f"       category={triage_result['category']} | "
@@ -81,18 +100,28 @@ def run_pipeline(
 
     search_query: str | None = None
     research_result: dict = {}
+    tried: set[str | None] = set()   # queries already run (None = ticket text)
+    retries = 0
 
     for attempt in range(MAX_RETRIES + 1):
         if attempt > 0:
             terms = research_result.get("suggested_search_terms", [])
             search_query = " ".join(terms) if terms else None
+            if search_query in tried:
+                # Nothing new to search for — an identical query would just
+                # re-pay for the same matches and summary
+                log("       No new search terms — drafting with available context.")
+                break
             log(f'       ↺ Retry {attempt}/{MAX_RETRIES} | query: "{search_query}"')
 
-        research_result = research(
+        tried.add(search_query)
+        retries = attempt
+        research_result = await research(
             ticket=ticket,
             store=store,
             client=oai_client,
             search_query=search_query,
+            cache=cache,
         )
 
         n = len(research_result.get("matches", []))
@@ -107,12 +136,12 @@ def run_pipeline(
             log("       Max retries reached — drafting with available context.")
 
     result["research"] = research_result
-    result["retries"] = attempt
+    result["retries"] = retries
 
     # ── Step 3: Drafter ──────────────────────────────────────────────────
     log("  [3/3] Drafting reply...")
 
-    draft_result = drafter(
+    draft_result = await drafter(
         ticket=ticket,
         triage_result=triage_result,
         research_result=research_result,
@@ -123,4 +152,74 @@ def run_pipeline(
     log("       sources_used=" + str(draft_result.get("sources_used", []))
         + (" | ⚠ stale sources used" if draft_result.get("stale_warning") else ""))
 
-    return result
\ No newline at end of file
+    return result
+
+
+async def process_batch(
+    tickets: list[dict],
+    store: VectorStore,
+    claude_client: anthropic.AsyncAnthropic | ClientPool | None = None,
+    oai_client: AsyncOpenAI | ClientPool | None = None,
+    concurrency: int = MAX_CONCURRENCY,
+    cache: ResultCache | None = None,
+) -> list[dict]:
+    """
+    Run many tickets through run_pipeline concurrently, at most `concurrency`
+    in flight at once, and return results in ticket order.
+
+    Triage for every uncached ticket is done up front with triage_batch, so
+    the shared system prompt is sent once per batch rather than per ticket.
+    If that fails, each ticket falls back to triaging itself in run_pipeline.
+
+    A ticket that raises doesn't sink the batch: its result comes back with
+    "error" set and no draft.
+    """
+    cached = [triage_lookup(t, cache) if cache else None for t in tickets]
+    misses = [t for t, c in zip(tickets, cached) if c is None]
+    try:
+        fresh = iter(
+            await triage_batch(misses, client=claude_client, cache=cache)
+            if misses else []
+        )
+    except Exception:
+        fresh = None
+    triaged = [
+        next(fresh) if triage_result is None and fresh is not None else triage_result
+        for triage_result in cached
+    ]
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run_one(ticket: dict, triage_result: dict | None) -> dict:
+        async with sem:
+            try:
+                return await run_pipeline(
+                    ticket=ticket,
+                    store=store,
+                    claude_client=claude_client,
+                    oai_client=oai_client,
+                    verbose=False,
+                    cache=cache,
+                    triage_result=triage_result,
+                )
+            except Exception as e:
+                return {
+                    "ticket": ticket,
+                    "triage": triage_result,
+                    "research": None,
+                    "draft": None,
+                    "skipped": False,
+                    "retries": 0,
+                    "error": f"{type(e).__name__}: {e}",
+                }
+
+    return list(await asyncio.gather(*(run_one(t, r) for t, r in zip(tickets, triaged))))
+
+
+def run_batch(tickets: list[dict], **kwargs) -> list[dict]:
+    """
+    Blocking wrapper around process_batch() for synchronous callers.
+    Each call runs its own event loop, so the shared clients are closed before
+    it ends — connections bound to a closed loop can't be reused.
+    """
+    return run_sync(process_batch(tickets, **kwargs))
@@ -19,22 +19,72 @@ Returns a dict matching the spec:
     "suggested_search_terms": list[str],
     "stale_ids":              list[str]   # source_ids of stale matches
 }
+
+For offline backfills, research_submit_batch() / research_collect_batch() run
+the same first-pass research through the OpenAI Batch API at half price.
 """
 
 from __future__ import annotations
-import json
+import asyncio
+import functools
 import re
-import sys
-from pathlib import Path
 
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI
+
+from build_kb import VectorStore
+from cache import ResultCache, content_key
+from clients import ClientPool, call_with_retry, get_openai, get_openai_pool, run_sync
+from triage import CATEGORY_SIGNALS
+
+MODEL          = "gpt-4o-mini"
+PROMPT_VERSION = "research-v1"   # bump when SYSTEM_PROMPT changes to invalidate the cache
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "kb"))
-from build_kb import VectorStore  # noqa: E402
+# Completion cap scales with the matches sent: each snippet is 50-80 words
+# (~150 tokens with its JSON keys), plus search terms and braces once
+MAX_TOKENS_BASE      = 128
+MAX_TOKENS_PER_MATCH = 160
 
 # Retry loop parameters — must match orchestrator expectations
 SIMILARITY_THRESHOLD = 0.7   # minimum cosine score to count as a strong match
 MIN_STRONG_MATCHES   = 2     # need at least this many strong matches to skip retry
+WEAK_MATCH_MARGIN    = 0.1   # top score this far below threshold → skip GPT entirely
+ELBOW_RATIO          = 0.5   # drop matches scoring under this fraction of the top score
+RAW_SNIPPET_WORDS    = 80    # content_snippet length when a match skips GPT
+
+# Dropped when deriving fallback search terms locally: function words, plus
+# the time words, hedges and filler tickets are full of that say nothing
+# about the problem itself
+STOPWORDS = frozenset("""
+a about after again all am an and any are as at be been but by can could did do
+does for from get got had has have hello hi how i i'm if in into is it it's its
+just me my no not of on or our please so some than thanks that the their them
+then there this to up us was we were what when which who why will with would
+you your
+ago already also always anymore anything can't cannot completely couldn't dear
+days doesn't don't even ever every getting help hey i've isn't keep keeps know
+last need never now problem really regards seems since something still sure
+thank time today tomorrow totally tried try trying unable very want week
+won't working yesterday
+""".split())
+
+# Known support phrases ("log in", "2fa", "refund") name the problem better
+# than any long word does, so they lead the derived terms
+_SIGNAL_RE = re.compile(r"\b(" + "|".join(
+    re.escape(s) for s in sorted(
+        {s for signals in CATEGORY_SIGNALS.values() for s in signals}, key=len, reverse=True
+    )
+) + r")\b")
+
+# One entry per retrieved match in the research prompt; scores are passed so
+# GPT can copy them faithfully
+MATCH_TEMPLATE = (
+    "[Match {i} | source_id={sid} | score={score:.3f} | type={type} | "
+    "category={category} | stale={stale}]\n{text}"
+)
+
+BATCH_POLL_SECONDS = 30
+BATCH_FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
 
 
 SYSTEM_PROMPT = """You are a knowledge-base research agent for a SaaS customer support team.
@@ -64,76 +114,351 @@ better KB matches for this ticket. Always include them — the orchestrator uses
 if a retry is needed."""
 
 
+_FENCE_RE = re.compile(r"```(?:json)?")
+_JSON_RE  = re.compile(r"\{.*\}", re.DOTALL)
+
+
 def _extract_json(text: str) -> dict:
-    text = re.sub(r"```(?:json)?", "", text).strip().rstrip("```").strip()
-    match = re.search(r"\{.*\}", text, re.DOTALL)
+    text = _FENCE_RE.sub("", text).strip().rstrip("```").strip()
+    match = _JSON_RE.search(text)
     if not match:
         raise ValueError(f"No JSON found in research response:\n{text}")
-    return json.loads(match.group())
+    return orjson.loads(match.group())
 
 
-def research(
+def _parse_json(text: str) -> dict:
+    """JSON mode returns a bare object; keep the regex scan only as a fallback."""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return _extract_json(text)
+
+
+async def research(
     ticket: dict,
     store: VectorStore,
-    client: OpenAI,
+    client: AsyncOpenAI | ClientPool | None = None,
     search_query: str | None = None,
     top_k: int = 3,
+    cache: ResultCache | None = None,
 ) -> dict:
     """
     Query the vector store, ask GPT to summarise matches, then set has_enough_info
     based on whether >= MIN_STRONG_MATCHES non-stale results score >= SIMILARITY_THRESHOLD.
 
-    ticket must have 'subject' and 'body' keys.
+    ticket must have 'subject' and 'body' keys. If cache is given, the GPT
+    summary is keyed on the exact prompt (ticket + retrieved matches), so it is
+    reused only while the KB returns the same matches.
     """
-    base_query = f"{ticket.get('subject', '')} {ticket.get('body', '')}".strip()
-    query = search_query or base_query
-    search_terms_used = query.split()[:6]
+    if search_query:
+        query, search_terms_used = search_query, search_query.split()[:6]
+    else:
+        query, search_terms_used = _base_query(ticket)
+
+    raw_matches, weak = await _retrieve(store, query, top_k)
+    if weak:
+        return _weak_result(query, search_terms_used, raw_matches)
+
+    user_message = _user_message(ticket, raw_matches)
+
+    key = content_key("research", model=MODEL, version=PROMPT_VERSION, message=user_message)
+    result = cache.get(key) if cache else None
+    if result is None:
+        result = await _summarise(client or get_openai_pool(), user_message, len(raw_matches))
+        if result is None:
+            # Cut off even at double the cap — no usable summary, use the raw matches
+            return _weak_result(query, search_terms_used, raw_matches)
+        if cache:
+            cache.set(key, result)
 
-    raw_matches = store.query(query, top_k=top_k)
+    return _finalize(result, search_terms_used=list(search_terms_used))
 
-    # Format matches for the prompt — pass scores so GPT can copy them faithfully
-    matches_text = "\n\n".join(
-        f"[Match {i + 1} | source_id={m['metadata'].get('source_id', f'item-{i}')} | "
-        f"score={m['score']:.3f} | "
-        f"type={m['metadata'].get('type', '?')} | "
-        f"category={m['metadata'].get('category', '?')} | "
-        f"stale={m['metadata'].get('stale', False)}]\n{m['text']}"
-        for i, m in enumerate(raw_matches)
+
+def research_sync(ticket: dict, store: VectorStore, **kwargs) -> dict:
+    """Blocking research() for synchronous callers."""
+    return run_sync(research(ticket, store, **kwargs))
+
+
+async def _retrieve(store: VectorStore, query: str, top_k: int) -> tuple[list[dict], bool]:
+    """
+    (KB matches for query, weak) — weak when even the best one is too far
+    below threshold for a GPT summary to help. Shared by research() and the
+    Batch API path so both see the same matches.
+    """
+    # VectorStore is synchronous (Chroma + embedding call) — keep it off the loop
+    raw_matches = await asyncio.to_thread(store.query, query, top_k=top_k)
+
+    # GPT can't raise cosine scores: if even the best match is well short of the
+    # threshold, this attempt can't be "enough" — skip the call and let the
+    # orchestrator retry with locally derived terms
+    top = max((m["score"] for m in raw_matches), default=0.0)
+    weak = top < SIMILARITY_THRESHOLD - WEAK_MATCH_MARGIN
+
+    # Elbow cut: matches far below the best one only cost prompt and snippet
+    # tokens. Can't drop a strong match — top <= 1 puts the cut below threshold.
+    return [m for m in raw_matches if m["score"] >= ELBOW_RATIO * top], weak
+
+
+def _weak_result(query: str, search_terms_used, raw_matches: list[dict]) -> dict:
+    """
+    research() result without a GPT summary: the retrieved matches as-is
+    (leading words as the snippet, real scores and stale flags), so the retry
+    decision is unchanged and the drafter still has whatever context there is.
+    """
+    matches = []
+    for m in raw_matches:
+        meta = m["metadata"]
+        matches.append({
+            "source_id":        meta.get("source_id"),
+            "content_snippet":  " ".join(m["text"].split()[:RAW_SNIPPET_WORDS]),
+            "similarity_score": m["score"],
+            "source_type":      meta.get("type", "faq"),
+            "stale":            meta.get("stale", False),
+        })
+    return _finalize(
+        {"matches": matches, "suggested_search_terms": _derive_terms(query)},
+        search_terms_used=list(search_terms_used),
     )
 
-    user_message = (
+
+def _base_query(ticket: dict) -> tuple[str, tuple[str, ...]]:
+    """(query text, search_terms_used) for a ticket's own text."""
+    return _terms(ticket.get("subject", ""), ticket.get("body", ""))
+
+
+@functools.lru_cache(maxsize=4096)
+def _terms(subject: str, body: str) -> tuple[str, tuple[str, ...]]:
+    # Memoised: retries and batch collection re-derive the same ticket's query
+    query = f"{subject} {body}".strip()
+    return query, tuple(query.split()[:6])
+
+
+def _derive_terms(query: str, n: int = 6) -> list[str]:
+    """
+    Up to n search terms for query: CATEGORY_SIGNALS phrases it contains
+    first, then its longest distinct non-stopword keywords in original order.
+    """
+    text = query.lower()
+    phrases = list(dict.fromkeys(_SIGNAL_RE.findall(text)))[:n]
+    covered = {w for p in phrases for w in p.split()}
+    words = []
+    for w in text.split():
+        w = w.strip(".,;:!?()[]{}\"'")
+        if len(w) > 2 and w not in STOPWORDS and w not in covered and w not in words:
+            words.append(w)
+    keep = set(sorted(words, key=len, reverse=True)[:n - len(phrases)])
+    return phrases + [w for w in words if w in keep]
+
+
+def _user_message(ticket: dict, raw_matches: list[dict]) -> str:
+    parts = []
+    for i, m in enumerate(raw_matches):
+        meta = m["metadata"]
+        parts.append(MATCH_TEMPLATE.format(
+            i=i + 1,
+            sid=meta.get("source_id", f"item-{i}"),
+            score=m["score"],
+            type=meta.get("type", "?"),
+            category=meta.get("category", "?"),
+            stale=meta.get("stale", False),
+            text=m["text"],
+        ))
+    matches_text = "\n\n".join(parts)
+
+    return (
         f"SUPPORT TICKET\n"
         f"Subject: {ticket.get('subject', '')}\n"
         f"Body: {ticket.get('body', '')}\n\n"
         f"RETRIEVED KB MATCHES:\n{matches_text}"
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0,
-        messages=[
+
+async def _summarise(
+    client: AsyncOpenAI | ClientPool,
+    user_message: str,
+    n_matches: int,
+) -> dict | None:
+    """
+    GPT's parsed reply. A reply cut off at the token cap (finish_reason
+    "length") is truncated JSON, so retry once at double the cap; None if
+    that is cut off too.
+    """
+    max_tokens = _max_tokens(n_matches)
+    for _ in range(2):
+        response = await call_with_retry(
+            client.chat.completions.create, **_request(user_message, max_tokens)
+        )
+        choice = response.choices[0]
+        if choice.finish_reason != "length":
+            return _parse_json(choice.message.content)
+        max_tokens *= 2
+    return None
+
+
+def _max_tokens(n_matches: int) -> int:
+    return MAX_TOKENS_BASE + MAX_TOKENS_PER_MATCH * n_matches
+
+
+def _request(user_message: str, max_tokens: int) -> dict:
+    """Chat-completions parameters — shared by the live call and Batch API lines."""
+    return {
+        "model": MODEL,
+        "temperature": 0,
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"},
+        "messages": [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_message},
         ],
-    )
+    }
+
 
-    result = _extract_json(response.choices[0].message.content)
-    result.setdefault("matches", [])
+def _finalize(result: dict, search_terms_used: list[str]) -> dict:
+    """Normalise GPT's reply to the spec's shape and derive has_enough_info / stale_ids."""
+    result["matches"] = [
+        m for m in map(_clean_match, result.get("matches") or []) if m is not None
+    ]
     result.setdefault("suggested_search_terms", [])
     result["search_terms_used"] = search_terms_used
 
     # ── Retry decision: driven by cosine scores, not GPT's opinion ──────────
-    # Count non-stale matches whose similarity_score meets the threshold.
-    # GPT copies scores from the prompt header, so these are the real values.
-    strong = sum(
-        1 for m in result["matches"]
-        if not m.get("stale") and m.get("similarity_score", 0) >= SIMILARITY_THRESHOLD
-    )
+    # Count non-stale matches whose similarity_score meets the threshold, and
+    # collect stale ids for orchestrator logging, in one pass. GPT copies
+    # scores from the prompt header, so these are the real values.
+    # _clean_match guarantees both keys, so index rather than .get().
+    strong = 0
+    stale_ids = []
+    threshold = SIMILARITY_THRESHOLD
+    for m in result["matches"]:
+        if m["stale"]:
+            stale_ids.append(m["source_id"])
+        elif m["similarity_score"] >= threshold:
+            strong += 1
     result["has_enough_info"] = strong >= MIN_STRONG_MATCHES
+    result["stale_ids"] = stale_ids
 
-    # Convenience list for orchestrator logging
-    result["stale_ids"] = [
-        m["source_id"] for m in result["matches"] if m.get("stale")
-    ]
+    return result
+
+
+def _clean_match(m) -> dict | None:
+    """
+    Coerce one match entry from GPT to the spec's types, filling defaults.
+    Returns None for entries without a source_id (nothing to cite).
+    """
+    if not isinstance(m, dict) or not m.get("source_id"):
+        return None
+    try:
+        score = float(m.get("similarity_score", 0.0))
+    except (TypeError, ValueError):
+        score = 0.0
+    stale = m.get("stale", False)
+    if isinstance(stale, str):
+        stale = stale.strip().lower() == "true"
+    return {
+        "source_id":        str(m["source_id"]),
+        "content_snippet":  str(m.get("content_snippet", "")),
+        "similarity_score": score,
+        "source_type":      m.get("source_type", "faq"),
+        "stale":            bool(stale),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Batch API — offline first-pass research for many tickets
+# ---------------------------------------------------------------------------
+
+async def research_submit_batch(
+    tickets: list[dict],
+    store: VectorStore,
+    client: AsyncOpenAI | None = None,
+    top_k: int = 3,
+) -> tuple[str | None, dict[str, dict]]:
+    """
+    Retrieve KB matches locally for each ticket, then queue the GPT summaries
+    as one OpenAI Batch API job (custom_id = ticket id).
+
+    Retrieval, the weak-match check and the elbow cut are the same as in
+    research(). Tickets with only weak matches are resolved locally, as
+    research() would, and never sent.
+
+    Returns (batch id or None if nothing was sent, {ticket_id: local result}).
+    Pass both to research_collect_batch().
+    """
+    lines = []
+    local: dict[str, dict] = {}
+    for ticket in tickets:
+        query, search_terms_used = _base_query(ticket)
+        raw_matches, weak = await _retrieve(store, query, top_k)
+        if weak:
+            local[ticket["id"]] = _weak_result(query, search_terms_used, raw_matches)
+            continue
+        lines.append(orjson.dumps({
+            "custom_id": ticket["id"],
+            "method":    "POST",
+            "url":       "/v1/chat/completions",
+            "body":      _request(
+                _user_message(ticket, raw_matches), _max_tokens(len(raw_matches))
+            ),
+        }))
+    if not lines:
+        return None, local
+
+    client = client or get_openai()
+    upload = await call_with_retry(
+        client.files.create,
+        file=("research.jsonl", b"\n".join(lines)),
+        purpose="batch",
+    )
+    job = await call_with_retry(
+        client.batches.create,
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return job.id, local
+
+
+async def research_collect_batch(
+    batch_id: str | None,
+    tickets: list[dict],
+    client: AsyncOpenAI | None = None,
+    local: dict[str, dict] | None = None,
+) -> dict[str, dict]:
+    """
+    Wait for a research_submit_batch() job and return {ticket_id: research result},
+    shaped exactly like research()'s return value, including the locally
+    resolved tickets passed as local. Tickets whose request failed inside
+    the batch, or whose reply was cut off at the token cap, are absent —
+    rerun those through research().
+    """
+    results: dict[str, dict] = dict(local or {})
+    if batch_id is None:
+        return results
+
+    client = client or get_openai()
+    # Polling can run for hours — one dropped connection mustn't lose the job
+    job = await call_with_retry(client.batches.retrieve, batch_id=batch_id)
+    while job.status not in BATCH_FINAL_STATES:
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        job = await call_with_retry(client.batches.retrieve, batch_id=batch_id)
+
+    if job.status != "completed" or not job.output_file_id:
+        raise RuntimeError(f"Research batch {batch_id} ended with status {job.status!r}")
+
+    by_id = {t["id"]: t for t in tickets}
+    output = await call_with_retry(client.files.content, file_id=job.output_file_id)
 
-    return result
\ No newline at end of file
+    for line in output.content.splitlines():
+        row  = orjson.loads(line)
+        resp = row.get("response") or {}
+        ticket = by_id.get(row.get("custom_id"))
+        if ticket is None or row.get("error") or resp.get("status_code") != 200:
+            continue
+        choice = resp["body"]["choices"][0]
+        if choice.get("finish_reason") == "length":
+            continue
+        results[ticket["id"]] = _finalize(
+            _parse_json(choice["message"]["content"]),
+            search_terms_used=list(_base_query(ticket)[1]),
+        )
+    return results
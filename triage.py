@@ -10,17 +10,60 @@ Returns a dict matching the spec:
 }
 
 is_spam is derived from category == "spam".
+
+triage_batch() classifies many tickets per request, sending the shared
+instructions once per batch instead of once per ticket.
+
+Model cascade: short, clear-cut or likely-spam tickets (keyword heuristic) go
+to FAST_MODEL, and only long, ambiguous ones reach MODEL. The heuristic never
+decides spam on its own — a real ticket marked spam gets no reply.
 """
 
 from __future__ import annotations
-import json
+import asyncio
 import re
 import anthropic
+import orjson
+
+from cache import ResultCache, content_key
+from clients import ClientPool, call_with_retry, get_anthropic_pool, run_sync
+
+MODEL          = "claude-opus-4-5"    # long / ambiguous tickets
+FAST_MODEL     = "claude-haiku-4-5"   # short or clear-cut tickets
+PROMPT_VERSION = "triage-v2"   # bump when the prompts or routing change to invalidate the cache
+
+SHORT_TICKET_CHARS = 500   # bodies shorter than this go to FAST_MODEL
+
+# Heuristic signals — lowercase whole words / phrases in subject + body. Spam
+# needs several independent hits before it even counts as a hint.
+SPAM_SIGNALS = (
+    "click here", "click the link", "act now", "guaranteed", "congratulations",
+    "claim your", "no experience needed", "limited spots", "lucrative",
+    "viagra", "casino", "crypto",
+)
+MIN_SPAM_SIGNALS = 2
+CATEGORY_SIGNALS = {
+    "billing":         ("invoice", "refund", "charge", "billing", "subscription"),
+    "account":         ("password", "log in", "login", "two-factor", "2fa", "locked out"),
+    "feature_request": ("feature request", "please add", "would be great if"),
+}
+
 
+def _signal_re(signals) -> re.Pattern:
+    # Word boundaries, so "act now" can't match inside "contact now"
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, signals)) + r")\b")
 
-SYSTEM_PROMPT = """You are a customer-support triage agent for a SaaS platform.
 
-Classify the incoming support ticket and set a priority level.
+_SPAM_RE     = _signal_re(SPAM_SIGNALS)
+_CATEGORY_RE = {c: _signal_re(signals) for c, signals in CATEGORY_SIGNALS.items()}
+
+BATCH_SIZE      = 20       # tickets per triage_batch request
+BATCH_MAX_CHARS = 40_000   # ~10k tokens of ticket text per request, well inside context
+
+
+_INSTRUCTIONS = """You are a customer-support triage agent for a SaaS platform.
+
+{task}
 
 Priority rules:
 - urgent: production down, data loss, locked out with imminent deadline
@@ -36,40 +79,217 @@ executable attachments, or anything not a real support request.
 Use priority=low when the ticket is vague, asks a question only tangentially related to
 the product, or has no immediate impact on the customer's ability to use the product.
 
-Reply with ONLY a JSON object — no prose, no markdown fences:
+"""
+
+SYSTEM_PROMPT = _INSTRUCTIONS.format(
+    task="Classify the incoming support ticket and set a priority level."
+) + """Reply with ONLY a JSON object — no prose, no markdown fences:
 {
   "category": "<category>",
   "priority": "<low|medium|high|urgent>",
   "reasoning": "<one sentence explaining the classification>"
 }"""
 
+BATCH_SYSTEM_PROMPT = _INSTRUCTIONS.format(
+    task="You will receive several numbered support tickets. Classify each one "
+         "independently and set its priority level."
+) + """Reply with ONLY a JSON object — no prose, no markdown fences — with one entry per ticket:
+{
+  "results": [
+    {
+      "index": <ticket number as given>,
+      "category": "<category>",
+      "priority": "<low|medium|high|urgent>",
+      "reasoning": "<one sentence explaining the classification>"
+    }
+  ]
+}"""
+
+
+_FENCE_RE = re.compile(r"```(?:json)?")
+_JSON_RE  = re.compile(r"\{.*\}", re.DOTALL)
+
 
 def _extract_json(text: str) -> dict:
-    text = re.sub(r"```(?:json)?", "", text).strip().rstrip("```").strip()
-    match = re.search(r"\{.*\}", text, re.DOTALL)
+    text = _FENCE_RE.sub("", text).strip().rstrip("```").strip()
+    match = _JSON_RE.search(text)
     if not match:
         raise ValueError(f"No JSON found in triage response:\n{text}")
-    return json.loads(match.group())
+    return orjson.loads(match.group())
+
+
+def _cached_system(prompt: str) -> list[dict]:
+    """System block marked for Anthropic prompt caching (reads bill at 10%)."""
+    return [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+# Prefilling the assistant turn with "{" makes Claude continue a bare JSON
+# object, so the reply normally parses directly without the regex scan.
+PREFILL = {"role": "assistant", "content": "{"}
 
 
-def triage(ticket: dict, client: anthropic.Anthropic) -> dict:
+def _parse_json(response) -> dict:
+    text = "{" + response.content[0].text
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return _extract_json(text)
+
+
+async def triage(ticket: dict, client: anthropic.AsyncAnthropic | ClientPool | None = None) -> dict:
     """
     Classify a ticket dict (must have 'subject' and 'body' keys).
     Returns triage result dict with keys: category, priority, reasoning, is_spam.
     """
+    hint = _quick_heuristic(ticket)
+    client = client or get_anthropic_pool()
     user_message = f"Subject: {ticket.get('subject', '')}\n\n{ticket.get('body', '')}"
 
-    response = client.messages.create(
-        model="claude-opus-4-5",
+    response = await call_with_retry(
+        client.messages.create,
+        model=_pick_model(ticket, hint),
         max_tokens=256,
-        system=SYSTEM_PROMPT,
-        messages=[{"role": "user", "content": user_message}],
+        system=_cached_system(SYSTEM_PROMPT),
+        messages=[{"role": "user", "content": user_message}, PREFILL],
     )
 
-    result = _extract_json(response.content[0].text)
+    return _normalize(_parse_json(response))
+
+
+def triage_sync(ticket: dict, **kwargs) -> dict:
+    """Blocking triage() for synchronous callers."""
+    return run_sync(triage(ticket, **kwargs))
+
+
+def cache_key(ticket: dict, model: str | None = None) -> str:
+    """
+    ResultCache key for a ticket's triage — text, model and prompt version.
+    model defaults to the one triage() would pick for this ticket.
+    """
+    return content_key(
+        "triage",
+        subject=ticket.get("subject", ""),
+        body=ticket.get("body", ""),
+        model=model or _pick_model(ticket, _quick_heuristic(ticket)),
+        version=PROMPT_VERSION,
+    )
+
+
+def cache_lookup(ticket: dict, cache: ResultCache) -> dict | None:
+    """
+    Cached triage for ticket: under its own model's key, else under MODEL's
+    (triage_batch escalates whole chunks, so a FAST_MODEL ticket may have been
+    classified by MODEL).
+    """
+    for model in dict.fromkeys((_pick_model(ticket, _quick_heuristic(ticket)), MODEL)):
+        result = cache.get(cache_key(ticket, model))
+        if result is not None:
+            return result
+    return None
+
+
+def _quick_heuristic(ticket: dict) -> str | None:
+    """
+    Return "spam" on MIN_SPAM_SIGNALS+ distinct spam hits, a category when
+    exactly one category's signals match, else None (ambiguous). Only a hint
+    for model choice — the model still makes the call.
+    """
+    text = f"{ticket.get('subject', '')}\n{ticket.get('body', '')}".lower()
+    if len(set(_SPAM_RE.findall(text))) >= MIN_SPAM_SIGNALS:
+        return "spam"
+    hits = [c for c, pattern in _CATEGORY_RE.items() if pattern.search(text)]
+    return hits[0] if len(hits) == 1 else None
+
+
+def _pick_model(ticket: dict, hint: str | None) -> str:
+    # A clear category (or likely spam) still needs confirming and a priority,
+    # but not the big model's judgement
+    if hint or len(ticket.get("body", "")) < SHORT_TICKET_CHARS:
+        return FAST_MODEL
+    return MODEL
+
+
+def _normalize(result: dict) -> dict:
     result.setdefault("category", "general")
     result.setdefault("priority", "medium")
     result.setdefault("reasoning", "")
     # Derive is_spam from category for internal orchestrator use
     result["is_spam"] = result["category"] == "spam"
-    return result
\ No newline at end of file
+    return result
+
+
+def _chunks(tickets: list[dict], batch_size: int) -> list[list[dict]]:
+    """Split tickets into batches capped by count and by total text length."""
+    chunks: list[list[dict]] = [[]]
+    chars = 0
+    for t in tickets:
+        size = len(t.get("subject", "")) + len(t.get("body", ""))
+        if chunks[-1] and (len(chunks[-1]) >= batch_size or chars + size > BATCH_MAX_CHARS):
+            chunks.append([])
+            chars = 0
+        chunks[-1].append(t)
+        chars += size
+    return chunks if chunks[0] else []
+
+
+async def _triage_chunk(
+    tickets: list[dict],
+    client: anthropic.AsyncAnthropic | ClientPool,
+) -> list[tuple[dict, str]]:
+    """(triage result, model that produced it) per ticket, in order."""
+    user_message = "\n\n".join(
+        f"TICKET {i}:\nSubject: {t.get('subject', '')}\n\n{t.get('body', '')}"
+        for i, t in enumerate(tickets)
+    )
+
+    # One request, one model — escalate the whole chunk if any ticket needs it
+    model = FAST_MODEL
+    if any(_pick_model(t, _quick_heuristic(t)) == MODEL for t in tickets):
+        model = MODEL
+
+    response = await call_with_retry(
+        client.messages.create,
+        model=model,
+        max_tokens=256 * len(tickets),
+        system=_cached_system(BATCH_SYSTEM_PROMPT),
+        messages=[{"role": "user", "content": user_message}, PREFILL],
+    )
+
+    by_index = {}
+    for r in _parse_json(response).get("results") or []:
+        # Tolerate "0" for 0; skip entries that aren't objects or lack an index
+        try:
+            by_index[int(r["index"])] = r
+        except (TypeError, KeyError, ValueError):
+            continue
+    # Any ticket the model skipped falls back to a single-ticket call
+    return [
+        (_normalize(by_index[i]), model) if i in by_index
+        else (await triage(t, client), _pick_model(t, _quick_heuristic(t)))
+        for i, t in enumerate(tickets)
+    ]
+
+
+async def triage_batch(
+    tickets: list[dict],
+    client: anthropic.AsyncAnthropic | ClientPool | None = None,
+    batch_size: int = BATCH_SIZE,
+    cache: ResultCache | None = None,
+) -> list[dict]:
+    """
+    Classify many tickets, batch_size per request (fewer if their combined text
+    exceeds BATCH_MAX_CHARS). Returns one triage result per ticket, in order.
+    If cache is given, each result is stored under the model that produced it
+    (read back with cache_lookup()).
+    """
+    client = client or get_anthropic_pool()
+    batches = await asyncio.gather(
+        *(_triage_chunk(chunk, client) for chunk in _chunks(tickets, batch_size))
+    )
+
+    results = []
+    for ticket, (result, model) in zip(tickets, (r for batch in batches for r in batch)):
+        if cache:
+            cache.set(cache_key(ticket, model), result)
+        results.append(result)
+    return results
\ No newline at end of file